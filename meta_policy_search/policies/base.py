@@ -1,6 +1,7 @@
 from meta_policy_search.utils.utils import remove_scope_from_name
 from meta_policy_search.utils import Serializable
 import tensorflow as tf
+import numpy as np
 from collections import OrderedDict
 
 
@@ -11,7 +12,7 @@ class Policy(Serializable):
 
     Note:
         the preupdate policy is stored as tf.Variables, while the postupdate
-        policy is stored in numpy arrays and executed through tf.placeholders
+        policies are stored in numpy arrays and written into per-task stacks of tf.Variables
 
     Args:
         obs_dim (int): dimensionality of the observation space -> specifies the input size of the policy
@@ -45,8 +46,17 @@ class Policy(Serializable):
 
         self._dist = None
         self.policy_params = None
-        self._assign_ops = None
+        self._assign_group = None
         self._assign_phs = None
+        self._assign_buffers = None
+        self._assign_fn = None
+        self._assign_fn_session = None
+        self._param_items = None
+        self._param_keys = None
+        self._param_vars = None
+        self._param_shapes = None
+        self._param_sizes = None
+        self._param_flat = None
 
     def build_graph(self):
         """
@@ -170,15 +180,58 @@ class Policy(Serializable):
         """
         return self.policy_params
 
+    def _get_param_items(self):
+        """
+        Get the (name, tf.Variable) pairs of the policy params. They are fixed once the graph is built and therefore
+        only collected once
+
+        Returns:
+            (tuple) : tuple of (name, tf.Variable) pairs in the order of get_params()
+        """
+        if self._param_items is None:
+            self._param_items = tuple(self.get_params().items())
+            self._param_keys = tuple(name for name, _ in self._param_items)
+            self._param_vars = tuple(var for _, var in self._param_items)
+            self._param_shapes = [var.shape.as_list() for var in self._param_vars]
+            self._param_sizes = [int(np.prod(shape)) for shape in self._param_shapes]
+        return self._param_items
+
     def get_param_values(self):
         """
         Gets a list of all the current weights in the network (in original code it is flattened, why?)
 
         Returns:
-            (list) : list of values for parameters
+            (OrderedDict) : dict of variable names and corresponding parameter values
+        """
+        self._get_param_items()
+        param_values = tf.get_default_session().run(self._param_vars)
+        return OrderedDict(zip(self._param_keys, param_values))
+
+    def get_param_values_flat(self):
+        """
+        Gets the current weights in the network concatenated into one flat vector (in the order of get_params())
+
+        Returns:
+            (ndarray) : flat array of the parameter values - shape: (n_params,)
+        """
+        if self._param_flat is None:
+            self._get_param_items()
+            self._param_flat = tf.concat([tf.reshape(var, [-1]) for var in self._param_vars], axis=0)
+        return tf.get_default_session().run(self._param_flat)
+
+    def set_param_values_flat(self, flat_params):
+        """
+        Sets the parameters for the graph from one flat vector as returned by get_param_values_flat
+
+        Args:
+            flat_params (ndarray): flat array of the parameter values - shape: (n_params,)
         """
-        param_values = tf.get_default_session().run(self.policy_params)
-        return param_values
+        self._get_param_items()
+        assert flat_params.shape == (sum(self._param_sizes),)
+
+        split_params = np.split(flat_params, np.cumsum(self._param_sizes)[:-1])
+        self.set_params(OrderedDict([(key, param.reshape(shape)) for key, param, shape
+                                     in zip(self._param_keys, split_params, self._param_shapes)]))
 
     def set_params(self, policy_params):
         """
@@ -187,20 +240,39 @@ class Policy(Serializable):
         Args:
             policy_params (dict): of variable names and corresponding parameter values
         """
-        assert all([k1 == k2 for k1, k2 in zip(self.get_params().keys(), policy_params.keys())]), \
+        param_items = self._get_param_items()
+        assert tuple(policy_params.keys()) == self._param_keys, \
             "parameter keys must match with variable"
 
-        if self._assign_ops is None:
+        # create the placeholders and assign ops only once and re-feed them on subsequent calls
+        # placeholders and buffers are stored as tuples aligned with self._param_keys
+        if self._assign_group is None:
             assign_ops, assign_phs = [], []
-            for var in self.get_params().values():
-                assign_placeholder = tf.placeholder(dtype=var.dtype)
-                assign_op = tf.assign(var, assign_placeholder)
-                assign_ops.append(assign_op)
+            for name, var in param_items:
+                assign_placeholder = tf.placeholder(dtype=var.dtype.base_dtype, shape=var.shape)
+                assign_ops.append(tf.assign(var, assign_placeholder))
                 assign_phs.append(assign_placeholder)
-            self._assign_ops = assign_ops
-            self._assign_phs = assign_phs
-        feed_dict = dict(zip(self._assign_phs, policy_params.values()))
-        tf.get_default_session().run(self._assign_ops, feed_dict=feed_dict)
+            # group all assignments into a single op so that one session call updates all variables
+            self._assign_group = tf.group(*assign_ops)
+            self._assign_phs = tuple(assign_phs)
+            # contiguous numpy buffers with the placeholders' dtype / shape that are re-used across calls
+            # (the Session API offers no way to register them as page-locked memory or to choose the copy stream)
+            self._assign_buffers = tuple(np.empty(ph.shape.as_list(), dtype=ph.dtype.as_numpy_dtype)
+                                         for ph in self._assign_phs)
+
+        # the assign op is run through a callable with a pre-bound feed list (rebuilt when the session changes)
+        sess = tf.get_default_session()
+        if sess is not self._assign_fn_session:
+            self._assign_fn = sess.make_callable(self._assign_group, feed_list=list(self._assign_phs))
+            self._assign_fn_session = sess
+
+        for name, buffer in zip(self._param_keys, self._assign_buffers):
+            value = policy_params[name]
+            # np.copyto broadcasts, so the shape has to be checked explicitly
+            assert np.shape(value) == buffer.shape, \
+                "shape of parameter %s must match with variable: %s vs. %s" % (name, np.shape(value), buffer.shape)
+            np.copyto(buffer, value, casting='same_kind')
+        self._assign_fn(*self._assign_buffers)
 
     def __getstate__(self):
         state = {
@@ -210,19 +282,34 @@ class Policy(Serializable):
         return state
 
     def __setstate__(self, state):
+        existing_vars = set(tf.global_variables())
         Serializable.__setstate__(self, state['init_args'])
-        tf.get_default_session().run(tf.global_variables_initializer())
+
+        # only initialize the variables created by this policy that are not overwritten by set_params afterwards
+        param_vars = set(self.get_params().values())
+        uninit_vars = [var for var in tf.global_variables() if var not in existing_vars and var not in param_vars]
+        if uninit_vars:
+            tf.get_default_session().run(tf.variables_initializer(uninit_vars))
         self.set_params(state['network_params'])
 
 
 class MetaPolicy(Policy):
+    """
+    Args:
+        param_dtype (tf.DType or str or None) : dtype of the task stacks that hold the per-task parameters
+            (see MetaGaussianMLPPolicy)
+    """
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, param_dtype=None, **kwargs):
         super(MetaPolicy, self).__init__(*args, **kwargs)
+        self.param_dtype = tf.as_dtype(param_dtype) if param_dtype is not None else None
         self._pre_update_mode = True
         self.policies_params_vals = None
         self.policy_params_keys = None
         self.policies_params_phs = None
+        self.policies_params_stacked_phs = None
+        self.policies_params_stacks = None
+        self._policies_params_assign_op = None
         self.meta_batch_size = None
 
     def build_graph(self):
@@ -237,7 +324,9 @@ class MetaPolicy(Policy):
         """
         self._pre_update_mode = True
         # replicate pre-update policy params meta_batch_size times
-        self.policies_params_vals = [self.get_param_values() for _ in range(self.meta_batch_size)]
+        self.policies_params_vals = OrderedDict([(key, np.repeat(np.expand_dims(value, axis=0), self.meta_batch_size, axis=0))
+                                                 for key, value in self.get_param_values().items()])
+        self._assign_policies_params()
 
     def get_actions(self, observations):
         if self._pre_update_mode:
@@ -265,24 +354,81 @@ class MetaPolicy(Policy):
             updated_policies_parameters (list): List of size meta-batch size. Each contains a dict with the policies
             parameters as numpy arrays
         """
-        self.policies_params_vals = updated_policies_parameters
+        assert len(updated_policies_parameters) == self.meta_batch_size
+        # store the parameters of all tasks as one stacked array per parameter - shape (meta_batch_size, *param_shape)
+        self.policies_params_vals = OrderedDict([(key, np.stack([params[key] for params in updated_policies_parameters]))
+                                                 for key in updated_policies_parameters[0].keys()])
+        self._assign_policies_params()
         self._pre_update_mode = False
 
-    def _create_placeholders_for_vars(self, scope, graph_keys=tf.GraphKeys.TRAINABLE_VARIABLES):
+    def _get_placeholder_specs(self, scope, graph_keys=tf.GraphKeys.TRAINABLE_VARIABLES):
+        """
+        Collects the variables in the scope once so that the placeholders of all tasks can be created from it
+
+        Args:
+            scope (str): variable scope of the variables to create placeholders for
+            graph_keys (str): graph collection to search for the variables
+
+        Returns:
+            (list) : list of (name, shape, dtype) tuples - one per variable
+        """
         var_list = tf.get_collection(graph_keys, scope=scope)
-        placeholders = []
-        for var in var_list:
-            var_name = remove_scope_from_name(var.name, scope.split('/')[0])
-            placeholders.append((var_name, tf.placeholder(tf.float32, shape=var.shape, name="%s_ph" % var_name)))
-        return OrderedDict(placeholders)
+        outer_scope = scope.split('/')[0]
+        return [(remove_scope_from_name(var.name, outer_scope), var.shape, var.dtype.base_dtype) for var in var_list]
+
+    def _create_placeholders_for_vars(self, var_specs):
+        """
+        Creates one placeholder per variable that holds the values of all tasks
+
+        Args:
+            var_specs (list): list of (name, shape, dtype) tuples as returned by _get_placeholder_specs
+
+        Returns:
+            (OrderedDict) : placeholders of shape (meta_batch_size, *var_shape) keyed by the variable names
+        """
+        return OrderedDict([(name, tf.placeholder(self.param_dtype or dtype, shape=[self.meta_batch_size] + shape.as_list(),
+                                                  name="%s_ph" % name))
+                            for name, shape, dtype in var_specs])
+
+    def _create_stacks_for_vars(self, var_specs):
+        """
+        Creates one non-trainable variable per policy variable that holds the parameter values of all tasks, together
+        with a single op that assigns the values fed into the stacked placeholders to them
+
+        Args:
+            var_specs (list): list of (name, shape, dtype) tuples as returned by _get_placeholder_specs
+
+        Returns:
+            (OrderedDict) : variables of shape (meta_batch_size, *var_shape) keyed by the variable names
+        """
+        self.policies_params_stacked_phs = self._create_placeholders_for_vars(var_specs)
+        stacks = OrderedDict([(name, tf.get_variable(name="%s_task_stack" % name,
+                                                     shape=[self.meta_batch_size] + shape.as_list(),
+                                                     dtype=self.param_dtype or dtype,
+                                                     initializer=tf.zeros_initializer(),
+                                                     trainable=False))
+                              for name, shape, dtype in var_specs])
+        self._policies_params_assign_op = tf.group(*[tf.assign(stacks[name], self.policies_params_stacked_phs[name])
+                                                     for name in stacks.keys()])
+        return stacks
+
+    def _assign_policies_params(self):
+        """
+        Writes the currently saved policy parameter values of all tasks into the persistent task stacks
+        """
+        feed_dict = {}
+        for key in self.policy_params_keys:
+            placeholder = self.policies_params_stacked_phs[key]
+            feed_dict[placeholder] = self.policies_params_vals[key].astype(placeholder.dtype.as_numpy_dtype, copy=False)
+        tf.get_default_session().run(self._policies_params_assign_op, feed_dict=feed_dict)
 
     @property
     def policies_params_feed_dict(self):
         """
             returns fully prepared feed dict for feeding the currently saved policy parameter values
-            into the lightweight policy graph
+            into the lightweight policy graph. The values are kept in the policies_params_stacks variables, hence
+            nothing has to be fed anymore
         """
-        return dict(list((self.policies_params_phs[i][key], self.policies_params_vals[i][key])
-                         for key in self.policy_params_keys for i in range(self.meta_batch_size)))
+        return {}
 
 
@@ -1,4 +1,4 @@
-from meta_policy_search.policies.networks.mlp import create_mlp, forward_mlp
+from meta_policy_search.policies.networks.mlp import create_mlp, create_mlp_params, forward_mlp
 from meta_policy_search.policies.distributions.diagonal_gaussian import DiagonalGaussian
 from meta_policy_search.policies.base import Policy
 from meta_policy_search.utils import Serializable, logger
@@ -7,6 +7,7 @@ from meta_policy_search.utils.utils import remove_scope_from_name
 import tensorflow as tf
 import numpy as np
 from collections import OrderedDict
+from contextlib import ExitStack
 
 
 class GaussianMLPPolicy(Policy):
@@ -25,16 +26,18 @@ class GaussianMLPPolicy(Policy):
         learn_std (boolean): whether the standard_dev / variance is a trainable or fixed variable
         init_std (float): initial policy standard deviation
         min_std( float): minimal policy standard deviation
+        jit_compile (boolean): whether to compile the forward passes used for sampling actions with XLA
 
     """
 
-    def __init__(self, *args, init_std=1., min_std=1e-6, **kwargs):
+    def __init__(self, *args, init_std=1., min_std=1e-6, jit_compile=False, **kwargs):
         # store the init args for serialization and call the super constructors
         Serializable.quick_init(self, locals())
         Policy.__init__(self, *args, **kwargs)
 
         self.min_log_std = np.log(min_std)
         self.init_log_std = np.log(init_std)
+        self.jit_compile = jit_compile
 
         self.init_policy = None
         self.policy_params = None
@@ -50,15 +53,24 @@ class GaussianMLPPolicy(Policy):
         """
         Builds computational graph for policy
         """
-        with tf.variable_scope(self.name):
-            # build the actual policy network
-            self.obs_var, self.mean_var = create_mlp(name='mean_network',
-                                                     output_dim=self.action_dim,
-                                                     hidden_sizes=self.hidden_sizes,
-                                                     hidden_nonlinearity=self.hidden_nonlinearity,
-                                                     output_nonlinearity=self.output_nonlinearity,
-                                                     input_dim=(None, self.obs_dim,)
-                                                     )
+        # resource variables are assigned through AssignVariableOp on their handle instead of ref-edge assigns
+        with tf.variable_scope(self.name, use_resource=True):
+            # build the actual policy network: create the variables first and then the forward pass on top of them so
+            # that with jit_compile only the forward ops (and not the variables and their initializers) use XLA
+            self.obs_var = tf.placeholder(dtype=tf.float32, shape=(None, self.obs_dim), name='input')
+            mean_network_params = create_mlp_params(name='mean_network',
+                                                    output_dim=self.action_dim,
+                                                    hidden_sizes=self.hidden_sizes,
+                                                    input_dim=self.obs_dim,
+                                                    )
+            with self._forward_scope():
+                _, self.mean_var = forward_mlp(output_dim=self.action_dim,
+                                               hidden_sizes=self.hidden_sizes,
+                                               hidden_nonlinearity=self.hidden_nonlinearity,
+                                               output_nonlinearity=self.output_nonlinearity,
+                                               input_var=self.obs_var,
+                                               mlp_params=mean_network_params,
+                                               )
 
             with tf.variable_scope("log_std_network"):
                 log_std_var = tf.get_variable(name='log_std_var',
@@ -79,6 +91,18 @@ class GaussianMLPPolicy(Policy):
             trainable_policy_vars = tf.get_collection(tf.GraphKeys.TRAINABLE_VARIABLES, scope=current_scope)
             self.policy_params = OrderedDict([(remove_scope_from_name(var.name, current_scope), var) for var in trainable_policy_vars])
 
+    def _forward_scope(self):
+        """
+        Returns the context in which the forward passes used for sampling actions are built. If jit_compile is set,
+        the ops created in it are marked for XLA compilation
+
+        Returns:
+            (contextmanager) : XLA jit scope or a no-op context
+        """
+        if self.jit_compile:
+            return tf.contrib.compiler.jit.experimental_jit_scope()
+        return ExitStack()
+
     def get_action(self, observation):
         """
         Runs a single observation through the specified policy and samples an action
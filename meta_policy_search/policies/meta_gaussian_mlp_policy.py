@@ -2,13 +2,34 @@ from meta_policy_search.policies.base import MetaPolicy
 from meta_policy_search.policies.gaussian_mlp_policy import GaussianMLPPolicy
 import numpy as np
 import tensorflow as tf
+from collections import OrderedDict
 from meta_policy_search.policies.networks.mlp import forward_mlp
 
 
 class MetaGaussianMLPPolicy(GaussianMLPPolicy, MetaPolicy):
-    def __init__(self, meta_batch_size,  *args, **kwargs):
+    """
+    Gaussian multi-layer perceptron policy for meta-learning that holds a pre-update policy and meta_batch_size
+    post-update policies
+
+    Note:
+        get_actions executes the policies of all tasks in one session call. The per-task post-update graphs are
+        independent of each other, so TensorFlow schedules them concurrently on its inter-op thread pool. Stepping
+        the environments of the tasks in parallel processes is done by the sampler (MetaSampler with parallel=True)
+
+    Args:
+        meta_batch_size (int): number of meta tasks
+        param_dtype (tf.DType or str or None): dtype of the task stacks that hold the per-task parameters (e.g.
+            tf.float16 to halve their memory and bandwidth). None uses the dtype of the policy variables. The policy
+            variables themselves (and set_params) keep their own dtype. Note that the task stacks also hold the
+            pre-update parameters after switch_to_pre_update and that the inner adaptation step of the meta-algos
+            (_adapt) starts from them, i.e. from the rounded parameters, whereas the meta-objective adapts from the
+            full precision policy variables
+        (see GaussianMLPPolicy for the remaining arguments)
+    """
+    def __init__(self, meta_batch_size,  *args, param_dtype=None, **kwargs):
         self.quick_init(locals()) # store init arguments for serialization
         self.meta_batch_size = meta_batch_size
+        self.param_dtype = tf.as_dtype(param_dtype) if param_dtype is not None else None
 
         self.pre_update_action_var = None
         self.pre_update_mean_var = None
@@ -18,6 +39,9 @@ class MetaGaussianMLPPolicy(GaussianMLPPolicy, MetaPolicy):
         self.post_update_mean_var = None
         self.post_update_log_std_var = None
 
+        self._forward_fns = {}
+        self._forward_fns_session = None
+
         super(MetaGaussianMLPPolicy, self).__init__(*args, **kwargs)
 
     def build_graph(self):
@@ -31,26 +55,37 @@ class MetaGaussianMLPPolicy(GaussianMLPPolicy, MetaPolicy):
         self.pre_update_mean_var = tf.split(self.mean_var, self.meta_batch_size)
         self.pre_update_log_std_var = [self.log_std_var for _ in range(self.meta_batch_size)]
 
-        # Create lightweight policy graph that takes the policy parameters as placeholders
-        with tf.variable_scope(self.name + "_ph_graph"):
-            mean_network_phs_meta_batch, log_std_network_phs_meta_batch = [], []
+        # Create lightweight policy graph that reads the policy parameters of each task from persistent variables
+        with tf.variable_scope(self.name + "_ph_graph", use_resource=True):
+            self.policies_params_phs = []
 
             self.post_update_action_var = []
             self.post_update_mean_var = []
             self.post_update_log_std_var = []
 
-            # build meta_batch_size graphs for post-update policies --> thereby the policy parameters are placeholders
+            # build meta_batch_size graphs for post-update policies --> thereby the policy parameters are task stacks
             obs_var_per_task = tf.split(self.obs_var, self.meta_batch_size, axis=0)
 
+            # create one variable per parameter with a leading meta_batch_size dimension -> returns ordered dict
+            param_specs = self._get_placeholder_specs(scope=self.name + "/mean_network") + \
+                          self._get_placeholder_specs(scope=self.name + "/log_std_network")
+            self.policies_params_stacks = self._create_stacks_for_vars(param_specs)
+
+            # split the param names into mean and log_std network once instead of once per task
+            mean_network_keys = [key for key in self.policies_params_stacks.keys() if 'log_std_network' not in key]
+            log_std_network_keys = [key for key in self.policies_params_stacks.keys() if 'log_std_network' in key]
+            assert len(log_std_network_keys) == 1
+
             for idx in range(self.meta_batch_size):
                 with tf.variable_scope("task_%i" % idx):
+                    # slice the parameters of the task out of the task stacks and cast them to the policy's dtype
+                    task_params = OrderedDict([(key, tf.cast(stack[idx], self.policy_params[key].dtype.base_dtype))
+                                               for key, stack in self.policies_params_stacks.items()])
+                    self.policies_params_phs.append(task_params)
 
-                    with tf.variable_scope("mean_network"):
-                        # create mean network parameter placeholders
-                        mean_network_phs = self._create_placeholders_for_vars(
-                            scope=self.name + "/mean_network")  # -> returns ordered dict
-                        mean_network_phs_meta_batch.append(mean_network_phs)
+                    mean_network_phs = OrderedDict([(key, task_params[key]) for key in mean_network_keys])
 
+                    with tf.variable_scope("mean_network"), self._forward_scope():
                         # forward pass through the mean mpl
                         _, mean_var = forward_mlp(output_dim=self.action_dim,
                                                   hidden_sizes=self.hidden_sizes,
@@ -60,12 +95,7 @@ class MetaGaussianMLPPolicy(GaussianMLPPolicy, MetaPolicy):
                                                   mlp_params=mean_network_phs,
                                                   )
 
-                    with tf.variable_scope("log_std_network"):
-                        # create log_stf parameter placeholders
-                        log_std_network_phs = self._create_placeholders_for_vars(scope=self.name + "/log_std_network") # -> returns ordered dict
-                        log_std_network_phs_meta_batch.append(log_std_network_phs)
-
-                        log_std_var = list(log_std_network_phs.values())[0]  # weird stuff since log_std_network_phs is ordered dict
+                    log_std_var = task_params[log_std_network_keys[0]]
 
                     action_var = mean_var + tf.random_normal(shape=tf.shape(mean_var)) * tf.exp(log_std_var)
 
@@ -73,13 +103,7 @@ class MetaGaussianMLPPolicy(GaussianMLPPolicy, MetaPolicy):
                     self.post_update_mean_var.append(mean_var)
                     self.post_update_log_std_var.append(log_std_var)
 
-            # merge mean_network_phs and log_std_network_phs into policies_params_phs
-            self.policies_params_phs = []
-            for idx, odict in enumerate(mean_network_phs_meta_batch): # Mutate mean_network_ph here
-                odict.update(log_std_network_phs_meta_batch[idx])
-                self.policies_params_phs.append(odict)
-
-            self.policy_params_keys = list(self.policies_params_phs[0].keys())
+            self.policy_params_keys = list(self.policies_params_stacks.keys())
 
     def get_action(self, observation, task=0):
         """
@@ -125,15 +149,14 @@ class MetaGaussianMLPPolicy(GaussianMLPPolicy, MetaPolicy):
         assert all([obs.shape[0] == batch_size for obs in observations])
         assert len(observations) == self.meta_batch_size
         obs_stack = np.concatenate(observations, axis=0)
-        feed_dict = {self.obs_var: obs_stack}
 
-        sess = tf.get_default_session()
-        actions, means, log_stds = sess.run([self.pre_update_action_var,
-                                             self.pre_update_mean_var,
-                                             self.pre_update_log_std_var],
-                                            feed_dict=feed_dict)
-        log_stds = np.concatenate(log_stds) # Get rid of fake batch size dimension (would be better to do this in tf, if we can match batch sizes)
-        agent_infos = [[dict(mean=mean, log_std=log_stds[idx]) for mean in means[idx]] for idx in range(self.meta_batch_size)]
+        # all tasks share the pre-update parameters -> run one forward pass on the stacked observations and split
+        forward_fn = self._get_forward_fn(pre_update=True)
+        actions, means, log_std = forward_fn(obs_stack)
+        actions = np.split(actions, self.meta_batch_size, axis=0)
+        means = np.split(means, self.meta_batch_size, axis=0)
+        log_std = log_std[0] # Get rid of fake batch size dimension
+        agent_infos = [[dict(mean=mean, log_std=log_std) for mean in means[idx]] for idx in range(self.meta_batch_size)]
         return actions, agent_infos
 
     def _get_post_update_actions(self, observations):
@@ -144,15 +167,34 @@ class MetaGaussianMLPPolicy(GaussianMLPPolicy, MetaPolicy):
         """
         assert self.policies_params_vals is not None
         obs_stack = np.concatenate(observations, axis=0)
-        feed_dict = {self.obs_var: obs_stack}
-        feed_dict.update(self.policies_params_feed_dict)
 
-        sess = tf.get_default_session()
-        actions, means, log_stds = sess.run([self.post_update_action_var,
-                                             self.post_update_mean_var,
-                                             self.post_update_log_std_var],
-                                            feed_dict=feed_dict)
+        forward_fn = self._get_forward_fn(pre_update=False)
+        actions, means, log_stds = forward_fn(obs_stack)
         log_stds = np.concatenate(log_stds) # Get rid of fake batch size dimension (would be better to do this in tf, if we can match batch sizes)
         agent_infos = [[dict(mean=mean, log_std=log_stds[idx]) for mean in means[idx]] for idx in range(self.meta_batch_size)]
         return actions, agent_infos
 
+    def _get_forward_fn(self, pre_update):
+        """
+        Returns a callable that runs the pre- or post-update policy forward pass. The callable is created via
+        Session.make_callable (only for the current session, they are rebuilt when the session changes) so that the
+        fetches and feeds do not have to be resolved at every call
+
+        Args:
+            pre_update (bool): whether to return the forward pass of the pre-update or the post-update policies
+
+        Returns:
+            (callable) : takes the stacked observations and returns actions, means and log_stds (stacked over all
+                         tasks for the pre-update policy and as lists with one entry per task for the post-update policies)
+        """
+        sess = tf.get_default_session()
+        if sess is not self._forward_fns_session:
+            self._forward_fns = {}
+            self._forward_fns_session = sess
+        if pre_update not in self._forward_fns:
+            if pre_update:
+                fetches = [self.action_var, self.mean_var, self.log_std_var]
+            else:
+                fetches = [self.post_update_action_var, self.post_update_mean_var, self.post_update_log_std_var]
+            self._forward_fns[pre_update] = sess.make_callable(fetches, feed_list=[self.obs_var])
+        return self._forward_fns[pre_update]
@@ -1,4 +1,5 @@
 import tensorflow as tf
+from collections import OrderedDict
 from meta_policy_search.utils.utils import get_original_tf_name, get_last_scope
 
 
@@ -62,6 +63,42 @@ def create_mlp(name,
     return input_var, output_var
 
 
+def create_mlp_params(name,
+                      output_dim,
+                      hidden_sizes,
+                      input_dim,
+                      w_init=tf.contrib.layers.xavier_initializer(),
+                      b_init=tf.zeros_initializer(),
+                      ):
+    """
+    Creates the variables of a MLP network without building its forward pass. The variables are named like the ones
+    created by create_mlp so that create_mlp(..., reuse=True) can be used on them
+    Args:
+        name (str): scope of the neural network
+        output_dim (int): dimension of the output
+        hidden_sizes (tuple): tuple with the hidden sizes of the fully connected network
+        input_dim (int): dimension of the input
+        w_init (tf.initializer): initializer for the weights
+        b_init (tf.initializer): initializer for the biases
+
+    Returns:
+        mlp_params (OrderedDict): OrderedDict of the params of the neural network in the order expected by forward_mlp
+
+    """
+    mlp_params = OrderedDict()
+    sizes = (input_dim,) + tuple(hidden_sizes) + (output_dim,)
+    layer_names = ['hidden_%d' % idx for idx in range(len(hidden_sizes))] + ['output']
+
+    with tf.variable_scope(name):
+        for layer_name, in_size, out_size in zip(layer_names, sizes[:-1], sizes[1:]):
+            with tf.variable_scope(layer_name):
+                mlp_params[layer_name + '/kernel'] = tf.get_variable('kernel', shape=(in_size, out_size),
+                                                                     dtype=tf.float32, initializer=w_init)
+                mlp_params[layer_name + '/bias'] = tf.get_variable('bias', shape=(out_size,),
+                                                                   dtype=tf.float32, initializer=b_init)
+    return mlp_params
+
+
 def forward_mlp(output_dim,
                 hidden_sizes,
                 hidden_nonlinearity,
@@ -72,6 +109,8 @@ def forward_mlp(output_dim,
     """
     Creates the forward pass of an mlp given the input vars and the mlp params. Assumes that the params are passed in
     order i.e. [hidden_0/kernel, hidden_0/bias, hidden_1/kernel, hidden_1/bias, ..., output/kernel, output/bias]
+    The loop over the params only runs while building the graph, the resulting graph is an unrolled sequence of
+    matmul / add / nonlinearity ops specialized to the given sizes and nonlinearities
     Args:
         output_dim (int): dimension of the output
         hidden_sizes (tuple): tuple with the hidden sizes of the fully connected network
@@ -23,9 +23,11 @@ class Serializable(object):
             spec = inspect.getfullargspec(self.__init__)
             # Exclude the first "self" parameter
             if spec.varkw:
-                kwargs = locals_[spec.varkw]
+                kwargs = dict(locals_[spec.varkw])
             else:
                 kwargs = dict()
+            # keyword-only arguments (declared after *args) are passed as keyword arguments
+            kwargs.update((arg, locals_[arg]) for arg in spec.kwonlyargs)
         else:
             spec = inspect.getargspec(self.__init__)
             if spec.keywords:
@@ -1,5 +1,7 @@
 import unittest
 from meta_policy_search.policies.gaussian_mlp_policy import GaussianMLPPolicy
+from meta_policy_search.policies.meta_gaussian_mlp_policy import MetaGaussianMLPPolicy
+from collections import OrderedDict
 import numpy as np
 import tensorflow as tf
 import pickle
@@ -97,6 +99,25 @@ class TestPolicy(unittest.TestCase):
 
         self.policy.set_params(all_param_values)
 
+    def testParamValuesFlat(self):
+        with tf.Session() as sess:
+            obs_dim = 23
+            action_dim = 7
+            self.policy = GaussianMLPPolicy(obs_dim,
+                                            action_dim,
+                                            name='test_policy_param_values_flat',
+                                            hidden_sizes=(64, 64))
+
+            sess.run(tf.global_variables_initializer())
+            param_values = self.policy.get_param_values()
+            flat_param_values = self.policy.get_param_values_flat()
+            self.assertTrue(np.allclose(flat_param_values,
+                                        np.concatenate([v.flatten() for v in param_values.values()])))
+
+            self.policy.set_param_values_flat(flat_param_values + 1.)
+            for k, v in self.policy.get_param_values().items():
+                self.assertTrue(np.allclose(v, param_values[k] + 1.))
+
     def testSerialize2(self):
         obs_dim = 2
         action_dim = 7
@@ -120,5 +141,146 @@ class TestPolicy(unittest.TestCase):
                 self.assertTrue(np.allclose(pre_agent_infos[key], post_agent_infos[key]))
 
 
+class TestMetaPolicy(unittest.TestCase):
+
+    def test_task_params(self):
+        with tf.Session() as sess:
+            obs_dim = 5
+            action_dim = 2
+            meta_batch_size = 3
+            env = DummyEnv(obs_dim, action_dim)
+            policy = MetaGaussianMLPPolicy(meta_batch_size,
+                                           obs_dim,
+                                           action_dim,
+                                           name='test_meta_policy_task_params',
+                                           hidden_sizes=(16, 16))
+
+            # reference forward pass with the parameters fed as placeholders
+            obs_ph = tf.placeholder(dtype=tf.float32, shape=(None, obs_dim))
+            params_phs = OrderedDict([(key, tf.placeholder(dtype=tf.float32, shape=var.shape))
+                                      for key, var in policy.get_params().items()])
+            dist_info_sym = policy.distribution_info_sym(obs_ph, params=params_phs)
+
+            sess.run(tf.global_variables_initializer())
+            pre_update_params = policy.get_param_values()
+
+            # different parameters for each task
+            task_params = [OrderedDict([(key, value + 0.1 * (idx + 1)) for key, value in pre_update_params.items()])
+                           for idx in range(meta_batch_size)]
+            policy.update_task_parameters(task_params)
+
+            observations = [env.get_obs(n=4) for _ in range(meta_batch_size)]
+            _, agent_infos = policy.get_actions(observations)
+            for idx in range(meta_batch_size):
+                feed_dict = {obs_ph: observations[idx]}
+                feed_dict.update(dict(zip(params_phs.values(), task_params[idx].values())))
+                dist_info = sess.run(dist_info_sym, feed_dict=feed_dict)
+                means = np.stack([agent_info['mean'] for agent_info in agent_infos[idx]])
+                self.assertTrue(np.allclose(means, dist_info['mean'], rtol=1e-5, atol=1e-5))
+                self.assertTrue(np.allclose(agent_infos[idx][0]['log_std'], dist_info['log_std'][0], rtol=1e-5, atol=1e-5))
+
+            # switching back to the pre-update policy resets the task stacks to the pre-update values
+            policy.switch_to_pre_update()
+            stacks = sess.run(policy.policies_params_stacks)
+            for key, stack in stacks.items():
+                for idx in range(meta_batch_size):
+                    self.assertTrue(np.allclose(stack[idx], pre_update_params[key]))
+
+            _, pre_update_agent_infos = policy.get_actions(observations)
+            feed_dict = {obs_ph: observations[0]}
+            feed_dict.update(dict(zip(params_phs.values(), pre_update_params.values())))
+            dist_info = sess.run(dist_info_sym, feed_dict=feed_dict)
+            means = np.stack([agent_info['mean'] for agent_info in pre_update_agent_infos[0]])
+            self.assertTrue(np.allclose(means, dist_info['mean'], rtol=1e-5, atol=1e-5))
+
+    def test_reduced_param_dtype(self):
+        with tf.Session() as sess:
+            obs_dim = 5
+            action_dim = 2
+            meta_batch_size = 3
+            env = DummyEnv(obs_dim, action_dim)
+            policy = MetaGaussianMLPPolicy(meta_batch_size,
+                                           obs_dim,
+                                           action_dim,
+                                           name='test_meta_policy_fp32',
+                                           hidden_sizes=(16, 16))
+            policy_fp16 = MetaGaussianMLPPolicy(meta_batch_size,
+                                                obs_dim,
+                                                action_dim,
+                                                name='test_meta_policy_fp16',
+                                                hidden_sizes=(16, 16),
+                                                param_dtype=tf.float16)
+
+            for key, stack in policy_fp16.policies_params_stacks.items():
+                self.assertEqual(stack.dtype.base_dtype, tf.float16)
+                self.assertEqual(policy_fp16.get_params()[key].dtype.base_dtype, tf.float32)
+
+            sess.run(tf.global_variables_initializer())
+            pre_update_params = policy.get_param_values()
+            policy_fp16.set_params(pre_update_params)
+
+            # set_params is not affected by param_dtype
+            for key, value in policy_fp16.get_param_values().items():
+                self.assertTrue(np.array_equal(value, pre_update_params[key]))
+
+            task_params = [OrderedDict([(key, value + 0.1 * (idx + 1)) for key, value in pre_update_params.items()])
+                           for idx in range(meta_batch_size)]
+            policy.update_task_parameters(task_params)
+            policy_fp16.update_task_parameters(task_params)
+
+            observations = [env.get_obs(n=4) for _ in range(meta_batch_size)]
+            _, agent_infos = policy.get_actions(observations)
+            _, agent_infos_fp16 = policy_fp16.get_actions(observations)
+            for idx in range(meta_batch_size):
+                for agent_info, agent_info_fp16 in zip(agent_infos[idx], agent_infos_fp16[idx]):
+                    for k in agent_info.keys():
+                        self.assertTrue(np.allclose(agent_info[k], agent_info_fp16[k], rtol=1e-2, atol=1e-2))
+
+    def test_jit_compile(self):
+        with tf.Session() as sess:
+            obs_dim = 5
+            action_dim = 2
+            meta_batch_size = 3
+            env = DummyEnv(obs_dim, action_dim)
+            policy = MetaGaussianMLPPolicy(meta_batch_size,
+                                           obs_dim,
+                                           action_dim,
+                                           name='test_meta_policy_jit',
+                                           hidden_sizes=(16, 16))
+            policy_jit = MetaGaussianMLPPolicy(meta_batch_size,
+                                               obs_dim,
+                                               action_dim,
+                                               name='test_meta_policy_jit_compiled',
+                                               hidden_sizes=(16, 16),
+                                               jit_compile=True)
+
+            sess.run(tf.global_variables_initializer())
+            pre_update_params = policy.get_param_values()
+            policy_jit.set_params(pre_update_params)
+            observations = [env.get_obs(n=4) for _ in range(meta_batch_size)]
+
+            # pre-update policies
+            policy.switch_to_pre_update()
+            policy_jit.switch_to_pre_update()
+            _, agent_infos = policy.get_actions(observations)
+            _, agent_infos_jit = policy_jit.get_actions(observations)
+            for idx in range(meta_batch_size):
+                for agent_info, agent_info_jit in zip(agent_infos[idx], agent_infos_jit[idx]):
+                    for k in agent_info.keys():
+                        self.assertTrue(np.allclose(agent_info[k], agent_info_jit[k], rtol=1e-5, atol=1e-5))
+
+            # post-update policies
+            task_params = [OrderedDict([(key, value + 0.1 * (idx + 1)) for key, value in pre_update_params.items()])
+                           for idx in range(meta_batch_size)]
+            policy.update_task_parameters(task_params)
+            policy_jit.update_task_parameters(task_params)
+            _, agent_infos = policy.get_actions(observations)
+            _, agent_infos_jit = policy_jit.get_actions(observations)
+            for idx in range(meta_batch_size):
+                for agent_info, agent_info_jit in zip(agent_infos[idx], agent_infos_jit[idx]):
+                    for k in agent_info.keys():
+                        self.assertTrue(np.allclose(agent_info[k], agent_info_jit[k], rtol=1e-5, atol=1e-5))
+
+
 if __name__ == '__main__':
     unittest.main()